@@ -1,30 +1,35 @@
 """
 Configuration management for the AI agent.
 """
-import os
-from typing import Dict, Any, Optional
-from pydantic_settings import BaseSettings
-from pydantic import Field
+from functools import lru_cache
+from typing import Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
+# Load .env once at import time; Settings construction below only reads the
+# already-populated environment.
+load_dotenv(override=True)
+
 class Settings(BaseSettings):
     """Application settings loaded from environment variables."""
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", frozen=True)
+
     # Required fields for local mode
-    openai_api_key: str = Field(..., env="OPENAI_API_KEY")
-    openai_model: str = Field("o3-mini", env="OPENAI_MODEL")
-    log_level: str = Field("INFO", env="LOG_LEVEL")
-    log_file: str = Field("agent.log", env="LOG_FILE")
-    
+    openai_api_key: str
+    openai_model: str = "o3-mini"
+    audit_samples: int = 1
+    openai_concurrency: int = 4
+    log_level: str = "INFO"
+    log_file: str = "agent.log"
+
     # Additional fields for server mode
-    agentarena_api_key: Optional[str] = Field(None, env="AGENTARENA_API_KEY")
-    webhook_auth_token: Optional[str] = Field(None, env="WEBHOOK_AUTH_TOKEN")
-    data_dir: Optional[str] = Field("./data", env="DATA_DIR")
-    
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    agentarena_api_key: Optional[str] = None
+    webhook_auth_token: Optional[str] = None
+    data_dir: Optional[str] = "./data"
+    uvicorn_workers: Optional[int] = None
+    audit_workers: int = 2
 
+@lru_cache(maxsize=1)
 def load_config() -> Settings:
-    """Load and return application configuration."""
-    load_dotenv(override=True)
-    return Settings() 
\ No newline at end of file
+    """Load and return the application configuration (parsed once per process)."""
+    return Settings()
@@ -1,20 +1,42 @@
 """
 Local execution mode for the AI agent.
 """
+import asyncio
+import atexit
 import json
 import os
 import logging
+import logging.handlers
+import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import git
-import glob
 import questionary
 from agent.services.auditor import SolidityAuditor
+from agent.logging_utils import BufferedFileHandler
 from agent.models.solidity_file import SolidityFile
 from agent.config import Settings
 
 logger = logging.getLogger(__name__)
 
+def _walk_solidity_files(root: str):
+    """
+    Yield repository-relative paths of all .sol files under root.
+
+    Uses os.scandir instead of glob so directory-vs-file checks come from the
+    cached DirEntry stat result rather than an extra stat syscall per entry.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.sol'):
+                    yield os.path.relpath(entry.path, root)
+
 def clone_repository(repo_url: str, commit_hash: str | None = None) -> str:
     """
     Clone a GitHub repository to a temporary directory.
@@ -28,12 +50,22 @@ def clone_repository(repo_url: str, commit_hash: str | None = None) -> str:
     """
     logger.info(f"Cloning repository: {repo_url}")
     temp_dir = tempfile.mkdtemp()
-    repo = git.Repo.clone_from(repo_url, temp_dir)
-    
+
     if commit_hash:
+        # Partial clone without checkout, then fetch just the requested
+        # commit; blobs are downloaded on demand during checkout.
+        repo = git.Repo.clone_from(
+            repo_url, temp_dir, multi_options=['--filter=blob:none', '--no-checkout']
+        )
         logger.info(f"Checking out commit: {commit_hash}")
+        repo.git.fetch('origin', commit_hash, depth=1)
         repo.git.checkout(commit_hash)
-        
+    else:
+        # Only the tip of the default branch is needed to read current files
+        repo = git.Repo.clone_from(
+            repo_url, temp_dir, multi_options=['--depth=1', '--single-branch']
+        )
+
     return temp_dir
 
 def select_files_interactively(all_files: List[str]) -> List[str]:
@@ -87,35 +119,32 @@ def find_solidity_contracts(repo_path: str, only_selected: bool = False) -> List
         List of SolidityFile objects
     """
     logger.info(f"Searching for Solidity contracts in {repo_path}")
-    
-    # Find all .sol files
-    all_files = [
-        os.path.relpath(f, repo_path)
-        for f in glob.glob(f"{repo_path}/**/*.sol", recursive=True)
-    ]
-    
+
     if only_selected:
-        selected_files = select_files_interactively(all_files)
+        # Interactive selection needs the full path list up front
+        selected_files = select_files_interactively(list(_walk_solidity_files(repo_path)))
+        max_workers = min(32, len(selected_files) or 1)
     else:
-        selected_files = all_files
-    
-    solidity_files = []
-    for file_path in selected_files:
+        # Stream paths straight from the walker into the readers; no
+        # intermediate path list is materialized.
+        selected_files = _walk_solidity_files(repo_path)
+        max_workers = 32
+
+    # Read files concurrently: the GIL is released during read(), so threads
+    # overlap disk latency on cold caches.
+    def read_one(file_path: str) -> SolidityFile | None:
         try:
             abs_path = os.path.join(repo_path, file_path)
             with open(abs_path, 'r', encoding='utf-8') as f:
                 content = f.read()
-            
-            solidity_files.append(
-                SolidityFile(
-                    path=file_path,
-                    content=content
-                )
-            )
+
+            return SolidityFile(path=file_path, content=content)
         except Exception as e:
             logger.error(f"Error reading contract {file_path}: {str(e)}")
-    
-    return solidity_files
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [f for f in executor.map(read_one, selected_files) if f is not None]
 
 def save_audit_results(output_path: str, audit: str):
     """
@@ -144,21 +173,35 @@ def process_local(repo_url: str, output_path: str, config: Settings, commit_hash
         commit_hash: Optional specific commit hash to checkout
         only_selected: Whether to enable interactive file selection
     """
-    # Configure logging to both console and file
-    log_file = config.log_file
+    # Configure logging to both console and file. The file handler is wrapped
+    # in a MemoryHandler so records are written in batches instead of one
+    # write() per record; ERROR records and shutdown force a flush.
+    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    file_handler = BufferedFileHandler(config.log_file)
+    # basicConfig only formats the MemoryHandler wrapper; flush() hands raw
+    # records to the target, so the file handler needs the formatter itself
+    file_handler.setFormatter(logging.Formatter(log_format))
+    memory_handler = logging.handlers.MemoryHandler(
+        capacity=1024,
+        flushLevel=logging.ERROR,
+        target=file_handler,
+        flushOnClose=True
+    )
     logging.basicConfig(
         level=getattr(logging, config.log_level),
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        format=log_format,
         handlers=[
-            logging.FileHandler(log_file),
+            memory_handler,
             logging.StreamHandler()
         ]
     )
+    atexit.register(logging.shutdown)
     
+    repo_path = None
     try:
         # Clone the repository
         repo_path = clone_repository(repo_url, commit_hash)
-        
+
         # Find Solidity contracts
         solidity_contracts = find_solidity_contracts(repo_path, only_selected)
         
@@ -168,9 +211,12 @@ def process_local(repo_url: str, output_path: str, config: Settings, commit_hash
         
         logger.info(f"Found {len(solidity_contracts)} Solidity contracts to audit")
         
-        # Audit contracts
-        auditor = SolidityAuditor(config.openai_api_key, config.openai_model)
-        audit = auditor.audit_files(solidity_contracts)
+        # Audit contracts file by file with bounded concurrency
+        auditor = SolidityAuditor(
+            config.openai_api_key, config.openai_model,
+            samples=config.audit_samples, concurrency=config.openai_concurrency
+        )
+        audit = asyncio.run(auditor.audit_contracts(solidity_contracts))
         audit_dict = [finding.model_dump() for finding in audit.findings]
 
         # Save results
@@ -180,4 +226,8 @@ def process_local(repo_url: str, output_path: str, config: Settings, commit_hash
         
     except Exception as e:
         logger.error(f"Error in local processing: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+    finally:
+        # Remove the cloned repository so temp directories don't leak
+        if repo_path:
+            shutil.rmtree(repo_path, ignore_errors=True)
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""
+Logging helpers for the AI agent.
+"""
+import logging
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler that writes through a 64 KiB buffer instead of the default
+    line buffering, so log records reach disk in bulk writes rather than one
+    syscall per newline. ERROR and above are flushed immediately.
+    """
+
+    BUFFER_SIZE = 65536
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=self.BUFFER_SIZE, encoding=self.encoding)
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            stream = self.stream
+            stream.write(msg + self.terminator)
+            if record.levelno >= logging.ERROR:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
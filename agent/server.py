@@ -1,25 +1,129 @@
 """
 Server implementation for the AI agent.
 """
-import json
+import asyncio
+import atexit
+import hmac
 import logging
-from typing import Optional
+import logging.handlers
+import queue
+from typing import List, Optional
 import httpx
+import orjson
 import tempfile
 import os
 import zipfile
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Header
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
+from agent.models.solidity_file import SolidityFile
 from agent.types import TaskResponse
 from agent.services.auditor import Audit, SolidityAuditor
-from agent.config import Settings
+from agent.logging_utils import BufferedFileHandler
+from agent.config import Settings, load_config
 import shutil
 
 logger = logging.getLogger(__name__)
-app = FastAPI(title="Solidity Audit Agent")
+app = FastAPI(title="Solidity Audit Agent", default_response_class=ORJSONResponse)
+
+_logging_configured = False
+
+def _configure_server_logging(config: Settings):
+    """
+    Configure logging to both console and file. Records are pushed onto a
+    queue and written by a background QueueListener thread, so logger calls
+    in the webhook and audit paths never block the event loop on file I/O.
+
+    Idempotent: uvicorn worker processes import the app fresh and call this
+    again from the startup hook, while the single-process path has already
+    configured logging in start_server.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+
+    file_handler = BufferedFileHandler(config.log_file)
+    memory_handler = logging.handlers.MemoryHandler(
+        capacity=1024,
+        flushLevel=logging.ERROR,
+        target=file_handler,
+        flushOnClose=True
+    )
+    log_queue = queue.Queue(-1)
+    logging.basicConfig(
+        level=getattr(logging, config.log_level),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[logging.handlers.QueueHandler(log_queue)]
+    )
+    listener = logging.handlers.QueueListener(
+        log_queue,
+        memory_handler,
+        logging.StreamHandler(),
+        respect_handler_level=True
+    )
+    listener.start()
+    # atexit runs callbacks LIFO: drain the queue before handlers are closed
+    atexit.register(logging.shutdown)
+    atexit.register(listener.stop)
+
+@app.on_event("startup")
+async def load_app_config():
+    """Ensure config and logging are set up; worker processes import the app fresh."""
+    if not hasattr(app.state, "config"):
+        app.state.config = load_config()
+    _configure_server_logging(app.state.config)
+
+@app.on_event("startup")
+async def create_http_client():
+    """Create one shared HTTP client so outbound calls reuse pooled connections."""
+    app.state.http = httpx.AsyncClient(
+        timeout=httpx.Timeout(600.0),
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        http2=True
+    )
+
+@app.on_event("startup")
+async def prepare_webhook_auth():
+    """Precompute the expected Authorization header for the webhook hot path."""
+    token = app.state.config.webhook_auth_token
+    app.state.expected_auth = f"token {token}".encode() if token else None
+
+@app.on_event("startup")
+async def start_audit_workers():
+    """Start the bounded audit queue and its persistent worker tasks."""
+    app.state.queue = asyncio.Queue(maxsize=128)
+    app.state.workers = [
+        asyncio.create_task(_audit_worker())
+        for _ in range(app.state.config.audit_workers)
+    ]
+
+@app.on_event("shutdown")
+async def stop_audit_workers():
+    """Cancel the audit worker tasks."""
+    for worker in app.state.workers:
+        worker.cancel()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    """Close the shared HTTP client and its connection pool."""
+    await app.state.http.aclose()
+
+async def _audit_worker():
+    """Consume notifications from the queue, one audit at a time per worker."""
+    while True:
+        notification = await app.state.queue.get()
+        try:
+            await process_notification(notification, app.state.config)
+        except Exception as e:
+            logger.error(f"Error processing queued notification: {str(e)}", exc_info=True)
+        finally:
+            app.state.queue.task_done()
 
 class Notification(BaseModel):
     """Payload received from AgentArena webhook."""
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     task_id: str
     task_repository_url: str  # URL to download repository ZIP
     task_details_url: str     # URL to get task details with selected files
@@ -30,33 +134,44 @@ class TaskContent(BaseModel):
     task_id: str
     files_content: str
 
-async def fetch_solidity_files(contracts_url: str, config: Settings) -> str:
+async def fetch_solidity_files(contracts_url: str, config: Settings, file_paths: Optional[List[str]] = None):
     """
-    Fetch Solidity files from the API.
-    
+    Fetch all Solidity files from the API in a single request.
+
     Args:
         contracts_url: URL to fetch contracts from
-        task_id: Task ID
-        file_paths: List of file paths to fetch
-        
+        config: Application configuration
+        file_paths: Optional list of paths to keep; others are discarded
+
     Returns:
-        List of SolidityFile objects
+        Parsed JSON response with the contract contents, or a list of
+        SolidityFile objects when file_paths is given, or None on failure
     """
     try:
-        async with httpx.AsyncClient() as client:
-            # Fetch all contracts at once from the contracts_url
-            response = await client.get(
-                contracts_url,
-                headers={"X-API-Key": config.agentarena_api_key}
-            )
-            response.raise_for_status()
-            
-            # Parse the response
-            return response.json()
-        
+        # Fetch all contracts at once from the contracts_url
+        response = await app.state.http.get(
+            contracts_url,
+            headers={"X-API-Key": config.agentarena_api_key}
+        )
+        response.raise_for_status()
+
+        # Parse the response with orjson instead of httpx's stdlib json path
+        contracts_data = orjson.loads(response.content)
+        if file_paths is None:
+            return contracts_data
+
+        # Membership checks against a set keep the filter O(N + M) instead
+        # of scanning the path list for every contract
+        wanted = set(file_paths)
+        return [
+            SolidityFile(path=c["path"], content=c["content"], repo_url=c.get("repo_url"))
+            for c in contracts_data
+            if c["path"] in wanted
+        ]
+
     except Exception as e:
         logger.error(f"Error fetching contracts: {str(e)}")
-    
+
     return None
 
 async def send_audit_results(callback_url: str, task_id: str, audit: Audit):
@@ -69,32 +184,37 @@ async def send_audit_results(callback_url: str, task_id: str, audit: Audit):
         audit: Audit results
     """
     try:
-        async with httpx.AsyncClient(timeout=600.0) as client:
-            # Convert Pydantic models to dict first
-            findings_dict = [finding.model_dump() for finding in audit.findings]
-            payload = {"task_id": task_id, "findings": findings_dict}
-            
-            # Log detailed payload information for debugging
-            logger.info(f"Sending audit results to {callback_url} for task {task_id}")
-            logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
-            
-            # Add more debugging info and increase timeout
-            response = await client.post(
-                callback_url, 
-                json=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "X-API-Key": app.state.config.agentarena_api_key
-                }
-            )
-            # Log response details
-            logger.info(f"Response status: {response.status_code}")
-            logger.debug(f"Response headers: {response.headers}")
-            logger.debug(f"Response content: {response.text}")
-            
-            response.raise_for_status()
-            logger.info(f"Successfully sent audit results for task {task_id}")
-            
+        # Convert Pydantic models to dict first, then serialize once with
+        # orjson (C-speed encoder, produces bytes directly) instead of going
+        # through httpx's stdlib json path.
+        findings_dict = [finding.model_dump() for finding in audit.findings]
+        payload = {"task_id": task_id, "findings": findings_dict}
+        body = orjson.dumps(payload)
+
+        # Log detailed payload information for debugging. The decode is
+        # guarded so it is skipped entirely when DEBUG is off.
+        logger.info(f"Sending audit results to {callback_url} for task {task_id}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request payload: %s", body.decode())
+
+        response = await app.state.http.post(
+            callback_url,
+            content=body,
+            headers={
+                "Content-Type": "application/json",
+                "X-API-Key": app.state.config.agentarena_api_key
+            }
+        )
+        # Log response details
+        logger.info(f"Response status: {response.status_code}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response headers: %s", response.headers)
+            logger.debug("Response content: %s", response.text)
+
+        response.raise_for_status()
+        logger.info(f"Successfully sent audit results for task {task_id}")
+
+
     except httpx.RequestError as e:
         # Network-related errors
         logger.error(f"Network error when sending audit results: {str(e)}", exc_info=True)
@@ -117,18 +237,70 @@ async def fetch_task_details(details_url: str, config: Settings) -> TaskResponse
         TaskResponse object containing task details including selectedFiles
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                details_url,
-                headers={"X-API-Key": config.agentarena_api_key}
-            )
-            response.raise_for_status()
-            task_data = response.json()
-            return TaskResponse(**task_data)
+        response = await app.state.http.get(
+            details_url,
+            headers={"X-API-Key": config.agentarena_api_key}
+        )
+        response.raise_for_status()
+        task_data = orjson.loads(response.content)
+        return TaskResponse(**task_data)
     except Exception as e:
         logger.error(f"Error fetching task details: {str(e)}", exc_info=True)
         return None
 
+def _extract_repository(temp_dir: str, zip_path: str, content: bytes, task_id: str, config: Settings) -> str:
+    """
+    Write the downloaded ZIP to disk, extract it, and copy the repository
+    into its data_dir location. Runs in a worker thread.
+
+    Args:
+        temp_dir: Temporary working directory
+        zip_path: Path to write the ZIP file to
+        content: Raw ZIP file bytes
+        task_id: Task ID for naming the repository directory
+        config: Application configuration
+
+    Returns:
+        Path to the stored repository directory
+    """
+    # Save ZIP file
+    with open(zip_path, "wb") as f:
+        f.write(content)
+
+    # Extract ZIP file
+    extract_dir = os.path.join(temp_dir, "extracted")
+    os.makedirs(extract_dir, exist_ok=True)
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        zip_ref.extractall(extract_dir)
+
+    # Find the actual repository root directory
+    # Most repositories have a single root directory inside the ZIP
+    contents = os.listdir(extract_dir)
+    if len(contents) == 1 and os.path.isdir(os.path.join(extract_dir, contents[0])):
+        # If there's only one item and it's a directory, that's our repo root
+        temp_repo_root = os.path.join(extract_dir, contents[0])
+        logger.info(f"Found repository root directory: {contents[0]}")
+    else:
+        # If there are multiple items, use the extract_dir as the root
+        temp_repo_root = extract_dir
+        logger.info("Using extracted directory as repository root")
+
+    # Setup repository location
+    repo_dir = os.path.join(config.data_dir, f"repo_{task_id}")
+    if not os.path.exists(config.data_dir):
+        os.makedirs(config.data_dir, exist_ok=True)
+
+    # If the repository already exists, remove it
+    if os.path.exists(repo_dir):
+        shutil.rmtree(repo_dir)
+
+    # Copy the extracted repository
+    shutil.copytree(temp_repo_root, repo_dir)
+    logger.info(f"Repository for task {task_id} stored at {repo_dir}")
+
+    return repo_dir
+
 async def setup_repository(repo_url: str, task_id: str, config: Settings) -> Optional[str]:
     """
     Download repository ZIP file, extract to temporary directory, and copy to location.
@@ -149,52 +321,20 @@ async def setup_repository(repo_url: str, task_id: str, config: Settings) -> Opt
         temp_dir = tempfile.mkdtemp()
         zip_path = os.path.join(temp_dir, "repo.zip")
         
-        # Download the ZIP file
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                repo_url,
-                headers={"X-API-Key": config.agentarena_api_key}
-            )
-            response.raise_for_status()
-            
-            # Save ZIP file
-            with open(zip_path, "wb") as f:
-                f.write(response.content)
-            
-            # Extract ZIP file
-            extract_dir = os.path.join(temp_dir, "extracted")
-            os.makedirs(extract_dir, exist_ok=True)
-            
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
-            
-            # Find the actual repository root directory
-            # Most repositories have a single root directory inside the ZIP
-            contents = os.listdir(extract_dir)
-            if len(contents) == 1 and os.path.isdir(os.path.join(extract_dir, contents[0])):
-                # If there's only one item and it's a directory, that's our repo root
-                temp_repo_root = os.path.join(extract_dir, contents[0])
-                logger.info(f"Found repository root directory: {contents[0]}")
-            else:
-                # If there are multiple items, use the extract_dir as the root
-                temp_repo_root = extract_dir
-                logger.info("Using extracted directory as repository root")
-            
-            # Setup repository location
-            repo_dir = os.path.join(config.data_dir, f"repo_{task_id}")
-            if not os.path.exists(config.data_dir):
-                os.makedirs(config.data_dir, exist_ok=True)
-            
-            # If the repository already exists, remove it
-            if os.path.exists(repo_dir):
-                shutil.rmtree(repo_dir)
-            
-            # Copy the extracted repository
-            shutil.copytree(temp_repo_root, repo_dir)
-            logger.info(f"Repository for task {task_id} stored at {repo_dir}")
-            
-            return repo_dir
-            
+        # Download the ZIP file over the shared client
+        response = await app.state.http.get(
+            repo_url,
+            headers={"X-API-Key": config.agentarena_api_key}
+        )
+        response.raise_for_status()
+
+        # Writing, extracting, and copying the archive are blocking file
+        # operations; run them in the default executor off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, _extract_repository, temp_dir, zip_path, response.content, task_id, config
+        )
+
     except Exception as e:
         logger.error(f"Error downloading repository: {str(e)}", exc_info=True)
         return None
@@ -207,6 +347,36 @@ async def setup_repository(repo_url: str, task_id: str, config: Settings) -> Opt
             except Exception as cleanup_error:
                 logger.error(f"Error cleaning up temporary directory {temp_dir}: {str(cleanup_error)}")
 
+def collect_solidity_files(repo_dir: str, selected_files: list) -> List[SolidityFile]:
+    """
+    Read selected contract files from the repository into SolidityFile objects.
+
+    Args:
+        repo_dir: Path to the repository directory
+        selected_files: List of file paths to read
+
+    Returns:
+        List of SolidityFile objects for the files that could be read
+    """
+    solidity_files = []
+    for file_path in selected_files:
+        full_path = os.path.join(repo_dir, file_path)
+        if not os.path.isfile(full_path):
+            logger.warning(f"Selected file not found: {file_path}")
+            continue
+        try:
+            try:
+                with open(full_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except UnicodeDecodeError:
+                # Try with different encoding if utf-8 fails
+                with open(full_path, 'r', encoding='latin-1') as f:
+                    content = f.read()
+            solidity_files.append(SolidityFile(path=file_path, content=content))
+        except Exception as e:
+            logger.error(f"Error reading selected file {file_path}: {str(e)}")
+    return solidity_files
+
 def read_and_concatenate_files(repo_dir: str, selected_files: list) -> str:
     """
     Read and concatenate content of selected files from the repository.
@@ -274,21 +444,29 @@ async def process_notification(notification: Notification, config: Settings):
             logger.error(f"Failed to download repository for task {notification.task_id}")
             return
         
-        # Read and concatenate selected files
-        concatenated_contracts = read_and_concatenate_files(repo_dir, task_details.selectedFiles)
-        if not concatenated_contracts:
+        # Read the selected contracts off the event loop
+        loop = asyncio.get_running_loop()
+        solidity_files = await loop.run_in_executor(
+            None, collect_solidity_files, repo_dir, task_details.selectedFiles
+        )
+        if not solidity_files:
             logger.warning(f"No valid contracts content found for task {notification.task_id}")
             return
-        
+
         # Read and concatenate selected docs
-        concatenated_docs = read_and_concatenate_files(repo_dir, task_details.selectedDocs)
+        concatenated_docs = await loop.run_in_executor(
+            None, read_and_concatenate_files, repo_dir, task_details.selectedDocs
+        )
         if not concatenated_docs:
             logger.info(f"No valid docs content found for task {notification.task_id}")
             # Continue anyway as docs are optional
         
         # Audit files
-        auditor = SolidityAuditor(config.openai_api_key, config.openai_model)
-        audit = auditor.audit_files(concatenated_contracts, concatenated_docs, task_details.additionalLinks, task_details.additionalDocs, task_details.qaResponses)
+        auditor = SolidityAuditor(
+            config.openai_api_key, config.openai_model,
+            samples=config.audit_samples, concurrency=config.openai_concurrency
+        )
+        audit = await auditor.audit_contracts(solidity_files, concatenated_docs, task_details.additionalLinks, task_details.additionalDocs, task_details.qaResponses)
         
         # Send results back
         await send_audit_results(notification.post_findings_url, notification.task_id, audit)
@@ -306,36 +484,38 @@ async def process_notification(notification: Notification, config: Settings):
 
 @app.post("/webhook")
 async def webhook(
-    notification: Notification, 
-    background_tasks: BackgroundTasks,
+    notification: Notification,
     authorization: str = Header(None)
 ):
     """
     Webhook endpoint for receiving notifications.
-    
+
     Args:
         notification: Notification payload
-        background_tasks: FastAPI background tasks
         authorization: Authorization header for webhook validation
-        
+
     Returns:
         Acknowledgement response
     """
-    # Validate authorization token
-    expected_auth = f"token {app.state.config.webhook_auth_token}"
-    if not authorization or authorization != expected_auth:
+    # Validate authorization token with a constant-time comparison against
+    # the header bytes precomputed at startup
+    expected_auth = app.state.expected_auth
+    if expected_auth is None or not authorization or not hmac.compare_digest(
+        authorization.encode(), expected_auth
+    ):
         logger.warning(f"Invalid authorization token provided")
         raise HTTPException(status_code=401, detail="Unauthorized")
     
     logger.info(f"Received notification for task {notification.task_id}")
-    
-    # Process the notification in the background
-    background_tasks.add_task(
-        process_notification, 
-        notification=notification, 
-        config=app.state.config
-    )
-    
+
+    # Hand the notification to the worker pool; a full queue surfaces
+    # backpressure to the caller instead of piling up unbounded tasks
+    try:
+        app.state.queue.put_nowait(notification)
+    except asyncio.QueueFull:
+        logger.warning(f"Audit queue full; rejecting task {notification.task_id}")
+        raise HTTPException(status_code=429, detail="Audit queue is full, retry later")
+
     return {"status": "processing", "task_id": notification.task_id}
 
 @app.get("/health")
@@ -353,21 +533,24 @@ def start_server(host: str, port: int, config: Settings):
         config: Application configuration
     """
     import uvicorn
-    
-    # Configure logging to both console and file
-    log_file = config.log_file
-    logging.basicConfig(
-        level=getattr(logging, config.log_level),
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
-    )
-    
+
+    _configure_server_logging(config)
+
     # Store config in app state
     app.state.config = config
     
-    # Start the server
-    logger.info(f"Starting server on {host}:{port}")
-    uvicorn.run(app, host=host, port=port) 
\ No newline at end of file
+    # Start the server. uvloop and httptools replace the stdlib event loop
+    # and h11 parser with C implementations; log_config=None keeps uvicorn
+    # from overriding the logging setup above.
+    workers = config.uvicorn_workers
+    if workers and workers > 1:
+        # Multi-process serving: workers must import the app by path, so each
+        # process sets up its config and logging via the startup hook
+        logger.info(f"Starting server on {host}:{port} with {workers} workers")
+        uvicorn.run(
+            "agent.server:app", host=host, port=port, workers=workers,
+            loop="uvloop", http="httptools", log_config=None
+        )
+    else:
+        logger.info(f"Starting server on {host}:{port}")
+        uvicorn.run(app, host=host, port=port, loop="uvloop", http="httptools", log_config=None) 
\ No newline at end of file
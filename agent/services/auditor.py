@@ -1,16 +1,74 @@
 """
 Core service for auditing Solidity contracts using OpenAI.
 """
+import asyncio
+import hashlib
+import io
 import json
 import logging
-from typing import List
-from pydantic import BaseModel, Field
-from openai import OpenAI
+from collections import OrderedDict
+from typing import List, Optional
+import httpx
+import ijson
+import openai
+from pydantic import BaseModel, Field, ValidationError
+from openai import AsyncOpenAI
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 
-from agent.services.prompts.audit_prompt import AUDIT_PROMPT
+from agent.models.solidity_file import SolidityFile
+from agent.services.prompts.audit_prompt import (
+    AUDIT_SYSTEM_PROMPT,
+    format_contracts_message,
+    format_context_message,
+)
 
 logger = logging.getLogger(__name__)
 
+class _ResponseCache:
+    """Process-local LRU cache of raw completion texts keyed by prompt hash."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached text for key, refreshing its LRU position."""
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: str, value: str):
+        """Store value under key, evicting the least recently used entry if full."""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+# Shared across auditor instances: repeated audits of the same repository
+# produce byte-identical prompts, so identical requests skip OpenAI entirely
+_response_cache = _ResponseCache()
+
+_openai_http_client: Optional[httpx.AsyncClient] = None
+
+def _get_openai_http_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide HTTP client used for OpenAI requests.
+
+    The server constructs a new SolidityAuditor per notification; a
+    per-instance client would leak its connection pool (it is never closed)
+    and re-do the TCP/TLS handshake for every audit. One shared client keeps
+    connections pooled across auditors and lives for the process lifetime.
+    """
+    global _openai_http_client
+    if _openai_http_client is None:
+        _openai_http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+            http2=True,
+            timeout=httpx.Timeout(600.0, connect=5.0)
+        )
+    return _openai_http_client
+
 class VulnerabilityFinding(BaseModel):
     """Model representing a single vulnerability finding."""
     title: str = Field(..., description="Title of the vulnerability")
@@ -22,21 +80,181 @@ class Audit(BaseModel):
     """Model representing the complete audit response."""
     findings: List[VulnerabilityFinding] = Field(default_factory=list, description="List of vulnerability findings")
 
+def _dedupe_findings(findings: List[VulnerabilityFinding]) -> List[VulnerabilityFinding]:
+    """Drop findings whose whitespace/case-normalized title was already seen."""
+    seen = set()
+    unique = []
+    for finding in findings:
+        key = " ".join(finding.title.lower().split())
+        if key not in seen:
+            seen.add(key)
+            unique.append(finding)
+    return unique
+
+@ijson.coroutine
+def _collect_findings(findings: List[VulnerabilityFinding]):
+    """ijson sink that validates each finding as soon as it is fully parsed."""
+    while True:
+        item = (yield)
+        findings.append(VulnerabilityFinding(**item))
+
 class SolidityAuditor:
     """Service for auditing Solidity contracts using OpenAI."""
     
-    def __init__(self, api_key: str, model: str):
+    def __init__(self, api_key: str, model: str, samples: int = 1, concurrency: int = 4):
         """
         Initialize the auditor with OpenAI credentials.
-        
+
         Args:
             api_key: OpenAI API key
             model: OpenAI model to use
+            samples: Number of concurrent completions to union per audit
+            concurrency: Maximum in-flight OpenAI requests for per-file audits
         """
         self.model = model
-        self.client = OpenAI(api_key=api_key)
+        self.samples = samples
+        self.concurrency = concurrency
+        # All auditor instances share one pooled HTTP client (see
+        # _get_openai_http_client); retries are handled by tenacity around
+        # _request_findings, so the SDK's own retry loop is disabled.
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            http_client=_get_openai_http_client(),
+            max_retries=0
+        )
+
+    @retry(
+        retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError, httpx.TransportError)),
+        stop=stop_after_attempt(3),
+        wait=wait_exponential_jitter(initial=1, max=20),
+        reraise=True
+    )
+    async def _request_findings(self, messages: List[dict], use_cache: bool = True) -> List[VulnerabilityFinding]:
+        """
+        Run one completion for the messages and return its parsed findings.
+        Rate-limit and transport errors are retried with jittered backoff.
+
+        Args:
+            messages: Chat messages for the completion
+            use_cache: Whether identical prompts may reuse cached responses
+
+        Returns:
+            List of validated VulnerabilityFinding objects
+        """
+        # Identical (model, prompt) pairs short-circuit to the cached
+        # response instead of paying for a second OpenAI round trip. The
+        # cache is bypassed when sampling, since samples must be independent.
+        prompt_text = "\0".join(message["content"] for message in messages)
+        cache_key = hashlib.sha256(
+            f"{self.model}\0{prompt_text}".encode()
+        ).hexdigest()
+        cached_text = _response_cache.get(cache_key) if use_cache else None
+
+        # Findings are parsed and validated incrementally as each one
+        # closes, instead of json.loads on the full response text
+        findings: List[VulnerabilityFinding] = []
+        parser = ijson.items_coro(_collect_findings(findings), "findings.item")
+
+        if cached_text is not None:
+            logger.info("Audit response cache hit; skipping OpenAI request")
+            parser.send(cached_text.encode())
+            parser.close()
+        else:
+            # Stream the completion so findings become available while
+            # the model is still generating
+            logger.info("Sending audit request to OpenAI (cache miss)")
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                response_format={"type": "json_object"},
+                stream=True
+            )
+
+            chunks = []
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    delta = chunk.choices[0].delta.content
+                    chunks.append(delta)
+                    parser.send(delta.encode())
+            parser.close()
+
+            if use_cache:
+                # Remember the full response for identical requests
+                _response_cache.put(cache_key, "".join(chunks))
+
+        return findings
 
-    def audit_files(self, contracts: str, docs: str = "", additional_links: List[str] = None, additional_docs: str = None, qa_responses: List = None) -> Audit:
+    @staticmethod
+    def format_contracts(solidity_files: List[SolidityFile]) -> str:
+        """
+        Concatenate SolidityFile objects into the contracts block of the prompt.
+
+        Args:
+            solidity_files: List of SolidityFile objects
+
+        Returns:
+            String with every contract labelled by path in a solidity code fence
+        """
+        # Stream the composition into a StringIO: join would allocate one
+        # large f-string per contract before concatenating, doubling peak
+        # memory for big codebases
+        buf = io.StringIO()
+        write = buf.write
+        first = True
+        for file in solidity_files:
+            if not first:
+                write("\n")
+            first = False
+            write("Contract: ")
+            write(file.path)
+            write("\n```solidity\n")
+            write(file.content)
+            write("\n```")
+        return buf.getvalue()
+
+    async def audit_contracts(self, solidity_files: List[SolidityFile], docs: str = "", additional_links: List[str] = None, additional_docs: str = None, qa_responses: List = None) -> Audit:
+        """
+        Audit contracts file by file with bounded concurrency.
+
+        Auditing is parallel at the contract level: each file gets its own
+        audit request, a semaphore caps in-flight OpenAI calls to respect
+        rate limits, and the merged findings are deduplicated by title.
+
+        Args:
+            solidity_files: List of SolidityFile objects to audit
+            docs: String containing documentation
+            additional_links: List of additional reference links
+            additional_docs: Additional documentation text
+            qa_responses: List of question-answer pairs
+
+        Returns:
+            Audit object containing the merged findings
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def audit_one(file: SolidityFile) -> Audit:
+            async with semaphore:
+                return await self.audit_files(
+                    self.format_contracts([file]), docs, additional_links, additional_docs, qa_responses
+                )
+
+        logger.info(f"Auditing {len(solidity_files)} contracts with concurrency {self.concurrency}")
+        # One file failing (e.g. a contract too large for the context window)
+        # must not discard the audits that did complete, so per-file errors
+        # are collected rather than propagated
+        audits = await asyncio.gather(
+            *[audit_one(file) for file in solidity_files], return_exceptions=True
+        )
+
+        findings = []
+        for file, audit in zip(solidity_files, audits):
+            if isinstance(audit, BaseException):
+                logger.error(f"Audit failed for {file.path}: {audit}")
+            else:
+                findings.extend(audit.findings)
+        return Audit(findings=_dedupe_findings(findings))
+
+    async def audit_files(self, contracts: str, docs: str = "", additional_links: List[str] = None, additional_docs: str = None, qa_responses: List = None) -> Audit:
         """
         Audit Solidity contracts and return structured findings.
         
@@ -50,74 +268,62 @@ class SolidityAuditor:
         Returns:
             Audit object containing the findings
         """
-        try:
-            # Initialize optional parameters
-            additional_links = additional_links or []
-            qa_responses = qa_responses or []
-            
-            # Format QA pairs for the prompt
-            qa_formatted = ""
-            if qa_responses:
-                qa_formatted = "## Q&A Information\n"
-                for qa in qa_responses:
-                    qa_formatted += f"Q: {qa.question}\nA: {qa.answer}\n\n"
-            
-            # Format additional links
-            links_formatted = ""
-            if additional_links:
-                links_formatted = "## Additional References\n"
-                for link in additional_links:
-                    links_formatted += f"- {link}\n"
-            
-            # Format additional documentation
-            additional_docs_formatted = ""
-            if additional_docs:
-                additional_docs_formatted = f"## Additional Documentation\n{additional_docs}\n"
-            
-            # Prepare the audit prompt with all information
-            audit_prompt = AUDIT_PROMPT.format(
-                contracts=contracts,
+        # Initialize optional parameters
+        additional_links = additional_links or []
+        qa_responses = qa_responses or []
+
+        # Format QA pairs for the prompt; parts are collected in a list
+        # and joined once instead of growing a string with +=
+        qa_formatted = "".join(f"Q: {qa.question}\nA: {qa.answer}\n\n" for qa in qa_responses)
+
+        # Format additional links
+        links_formatted = "".join(f"- {link}\n" for link in additional_links)
+
+        # Messages are ordered so every request shares a byte-identical
+        # prefix: fixed instructions, then the contracts (invariant across
+        # audits of the same code), with only the final user message varying.
+        # This maximizes provider prompt-prefix cache hits.
+        messages = [
+            {"role": "system", "content": AUDIT_SYSTEM_PROMPT},
+            {"role": "system", "content": format_contracts_message(contracts)},
+            {"role": "user", "content": format_context_message(
                 docs=docs,
+                additional_docs=additional_docs or "",
                 additional_links=links_formatted,
-                additional_docs=additional_docs_formatted,
                 qa_responses=qa_formatted
-            )
-            
-            # Send single request to OpenAI
-            logger.info("Sending audit request to OpenAI")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert Solidity smart contract auditor."},
-                    {"role": "user", "content": audit_prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
-            
-            # Extract and parse the JSON response
-            result_text = response.choices[0].message.content
-            logger.debug(f"Received audit response from OpenAI")
-            
-            try:
-                # Parse the JSON response
-                audit_result = json.loads(result_text)
-                
-                # Validate using Pydantic model
-                validated_result = Audit(**audit_result)
-                
-                findings_dict = [finding.model_dump(mode="json") for finding in validated_result.findings]
-                logger.info(f"Audit result: {json.dumps(findings_dict, indent=2)}")
-
-                logger.info(f"Audit completed successfully with {len(validated_result.findings)} findings")
-                return validated_result
-            except json.JSONDecodeError as json_err:
-                logger.error(f"Failed to parse JSON response: {json_err}")
-                logger.debug(f"Raw response: {result_text}")
-                return Audit(findings=[])
-            except Exception as validation_err:
-                logger.error(f"Validation error with audit response: {validation_err}")
-                return Audit(findings=[])
-                
-        except Exception as e:
-            logger.error(f"Error during audit: {str(e)}", exc_info=True)
+            )}
+        ]
+
+        # Transient OpenAI errors are retried with backoff inside
+        # _request_findings; anything that exhausts the retry budget
+        # propagates to the caller instead of being swallowed here
+        try:
+            if self.samples > 1:
+                # Self-consistency sampling: draw several completions for
+                # the same prompt concurrently and take the union of their
+                # findings; coverage improves at no extra wall time
+                sampled = await asyncio.gather(
+                    *[self._request_findings(messages, use_cache=False) for _ in range(self.samples)]
+                )
+                findings = [finding for sample in sampled for finding in sample]
+            else:
+                findings = await self._request_findings(messages)
+
+            # Duplicate titles add noise (and tokens for any downstream
+            # prompt reuse) without adding findings; keep the first of each
+            unique_findings = _dedupe_findings(findings)
+            if len(unique_findings) < len(findings):
+                logger.info(f"Dropped {len(findings) - len(unique_findings)} duplicate findings")
+            validated_result = Audit(findings=unique_findings)
+
+            findings_dict = [finding.model_dump(mode="json") for finding in validated_result.findings]
+            logger.info(f"Audit result: {json.dumps(findings_dict, indent=2)}")
+
+            logger.info(f"Audit completed successfully with {len(validated_result.findings)} findings")
+            return validated_result
+        except ijson.JSONError as json_err:
+            logger.error(f"Failed to parse JSON response: {json_err}")
+            return Audit(findings=[])
+        except ValidationError as validation_err:
+            logger.error(f"Validation error with audit response: {validation_err}")
             return Audit(findings=[])
\ No newline at end of file
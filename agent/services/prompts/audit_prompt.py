@@ -1,4 +1,10 @@
-AUDIT_PROMPT = """
+# The prompt is split so that every request starts with a byte-identical
+# prefix: the fixed instructions, then the contracts block (invariant across
+# repeated audits of the same repository), and only then the variable
+# documentation/Q&A context. Providers cache by shared prompt prefix, so this
+# ordering lets repeat audits hit the prefix cache for the expensive part.
+
+AUDIT_SYSTEM_PROMPT = """
 You are an expert Solidity smart contract auditor. Analyze the provided smart contracts and identify security vulnerabilities, bugs, and optimization opportunities.
 
 ## Instructions
@@ -9,7 +15,7 @@ You are an expert Solidity smart contract auditor. Analyze the provided smart co
 
 ## Vulnerability Categories
 - Access control flaws (missing modifiers, incorrect role checks)
-- Business logic errors (calculation mistakes, state inconsistencies)  
+- Business logic errors (calculation mistakes, state inconsistencies)
 - Arithmetic issues (precision loss, division by zero)
 - External call risks (unchecked return values, unsafe interactions)
 - Input validation (missing checks, boundary conditions)
@@ -24,32 +30,28 @@ You are an expert Solidity smart contract auditor. Analyze the provided smart co
 ## Response Format
 Return your findings in the following JSON format:
 ```json
-{{
+{
     "findings": [
-    {{
+    {
         "title": "Clear, concise title of the vulnerability",
         "description": "Detailed explanation including how the vulnerability could be exploited and recommendation to fix",
         "severity": "High|Medium|Low|Info",
         "file_paths": ["path/to/file/affected/by/vulnerability", "path/to/another/file/affected/by/vulnerability"]
-    }}
+    }
     ]
-}}
-```
-
-## Smart Contracts to Audit
-```solidity
-{contracts}
+}
 ```
-
-## Documentation
-{docs}
-
-## Additional Documentation
-{additional_docs}
-
-## Additional Links
-{additional_links}
-
-## Q&A Information
-{qa_responses}
-"""
\ No newline at end of file
+"""
+
+def format_contracts_message(contracts: str) -> str:
+    """Render the contracts message, invariant across audits of the same code."""
+    return "## Smart Contracts to Audit\n```solidity\n" + contracts + "\n```"
+
+def format_context_message(docs: str, additional_docs: str, additional_links: str, qa_responses: str) -> str:
+    """Render the variable documentation/links/Q&A message."""
+    return (
+        "## Documentation\n" + docs +
+        "\n\n## Additional Documentation\n" + additional_docs +
+        "\n\n## Additional Links\n" + additional_links +
+        "\n\n## Q&A Information\n" + qa_responses + "\n"
+    )